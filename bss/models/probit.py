@@ -1,15 +1,47 @@
+import inspect
+import multiprocessing
 import operator
-from cachetools import cachedmethod, Cache
+from cachetools import cachedmethod, LRUCache
 import numpy as np
-from scipy.stats import beta, gamma, norm
+import scipy.linalg
+from scipy.stats import norm
 
 from bss import logger
 from bss.mvn import Mvn
+from bss.univariate import Beta, Gamma, Normal
 from bss.samplers.slice import SliceSampler
 from bss.samplers.elliptical import EllipticalSliceSampler
 
+_LOG_2PI = np.log(2 * np.pi)
+
+
+def _run_chain(args):
+    """
+    Run a single MCMC chain on a model with a given random seed. Used by `Probit.run_mcmc_parallel` in its worker
+    processes.
+    """
+    model, seed, iters, burn_in, detailed = args
+    np.random.seed(seed)
+    return model.run_mcmc(iters=iters, burn_in=burn_in, detailed=detailed)
+
 
 class Probit:
+    # Whether xi is sampled along with the other model parameters; see ProbitSampleXi
+    sample_xi = False
+
+    def __new__(cls, *args, **kwargs):
+        """
+        Instantiating a Probit model where xi is to be sampled (xi=None) creates a `ProbitSampleXi` model instead.
+        This keeps the check for whether xi is sampled out of every MCMC step.
+        """
+        # Unpickling and copying call __new__ without arguments, for an instance that is already of the right class
+        if cls is Probit and (args or kwargs):
+            arguments = inspect.signature(Probit.__init__).bind(None, *args, **kwargs)
+            arguments.apply_defaults()
+            if arguments.arguments['xi'] is None:
+                cls = ProbitSampleXi
+        return super().__new__(cls)
+
     def __init__(self, X, Y, R, target_sparsity=0.01, gamma0_v=1.0, lambda_params=(1e-6, 1e-6), nu_params=(1e-6, 1e-6),
                  xi=0.999999, xi_prior_shape=(1, 1), check_finite=True, min_eigenval=0, jitter=1e-6):
         """The Probit model used for modeling Sparse Regression using a Gaussian field. :cite:`Engelhardt2014`.
@@ -53,7 +85,8 @@ class Probit:
         check_finite : bool
             Whether to check that the input matrices contain only finite numbers. Disabling may give a performance gain,
             but may result in problems (crashes, non-termination) if the inputs do contain infinities or NaNs.
-            This parameter is passed on to several linear algebra functions in scipy internally.
+            The inputs are checked once, here. The matrices the model derives from them are then finite by
+            construction, so the linear algebra functions in scipy that they are passed to internally skip the check.
         min_eigenval : float
             Minimum Eigenvalue we can accept in the covariance matrix. Any eigenvalues encountered below this threshold
             are set to zero, and the resulting covariance matrix normalized to give ones on the diagonal.
@@ -61,54 +94,103 @@ class Probit:
             A small value to add to the diagonals of the covariance matrix to avoid conditioning issues.
         """
 
+        if check_finite:
+            X, Y = np.asarray_chkfinite(X), np.asarray_chkfinite(Y)
+
         self.X = X
         self.Y = Y
-        self.R = Mvn(cov=R, min_eigenval=min_eigenval, jitter=jitter)
+        self.R = Mvn(cov=R, min_eigenval=min_eigenval, jitter=jitter, check_finite=check_finite)
 
         self.N, self.P = self.X.shape
 
+        # Inner products of the predictors and the response, from which the corresponding products for any subset of
+        # included SNPs are obtained by indexing. See _ppi_gram.
+        self._Xt1 = np.sum(self.X, axis=0)
+        self._XtY = np.dot(self.X.T, self.Y)
+        self._yy = np.dot(self.Y, self.Y)
+
         self.nu_a, self.nu_b = nu_params
 
         self.check_finite = check_finite
 
-        if xi is None:
-            self.sample_xi = True
-            self._xi_distribution = beta(*xi_prior_shape)
+        if self.sample_xi:
+            self._xi_distribution = Beta(*xi_prior_shape)
             self.xi = self._xi_distribution.mean()
+
+            # The eigendecomposition R = V diag(w) V^T, which simultaneously diagonalizes the probit covariance
+            # matrices xi * R + (1 - xi) * I for all values of xi. See update_xi.
+            self._R_eigvals, self._R_eigvecs = scipy.linalg.eigh(self.R.cov, check_finite=check_finite)
         else:
-            self.sample_xi = False
             self.xi = xi
 
         # Initialize scalar model distributions and the parameter values to their prior means.
-        self._gamma0_distribution = norm(loc=norm.ppf(1.0 - target_sparsity), scale=gamma0_v)
+        # These distributions are evaluated many times in every MCMC step (most of them inside slice sampling loops),
+        # so we use the lightweight scalar distributions of bss.univariate rather than scipy.stats.
+        self._gamma0_distribution = Normal(loc=norm.ppf(1.0 - target_sparsity), scale=gamma0_v)
         self.gamma0 = self._gamma0_distribution.mean()
-        self._lambda_distribution = gamma(lambda_params[0], scale=1./lambda_params[1])
+        self._lambda_distribution = Gamma(*lambda_params)
         self.lamb = self._lambda_distribution.mean()
-        self._nu_distribution = gamma(self.nu_a, scale=1./self.nu_b)
+        self._nu_distribution = Gamma(self.nu_a, self.nu_b)
         self.nu = self._nu_distribution.mean()
 
+        # The shape parameter of the conditional posterior of nu does not depend on the other model parameters.
+        # See update_nu.
+        self._nu_post_a = self.nu_a + 0.5 * self.N
+
         # Cache for holding probit prior distributions (multivariate normal distributions with 0 mean and known
         # covariance, possibly adjusted by a shrinkage factor xi expressing our confidence in the covariance).
         # A single iteration of MCMC calls on many computations on this distribution, so caching improves performance
-        # significantly. A small cache size works just as well as a large one,
+        # significantly. A small LRU cache works just as well as a large one,
         # because the most recently used distribution tends to be used repeatedly in a single MCMC step.
-        self._probit_cache = Cache(maxsize=4)
+        self._probit_cache = LRUCache(maxsize=4)
 
         # A cache used to hold the marginal PPI (Posterior Probability of Inclusion) distributions
         # p(y | X, gamma, gamma_0, nu, lambda) ~ Normal(..)
-        # A small cache size works just as well as a large one, because the most recently used distribution tends to
+        # A small LRU cache works just as well as a large one, because the most recently used distribution tends to
         # be used repeatedly in a single MCMC step.
-        self._ppi_cache = Cache(maxsize=8)
+        self._ppi_cache = LRUCache(maxsize=8)
+
+        # The inclusion mask of the last PPI distribution computed, along with the N x N matrix X[:, mask] X[:, mask]^T
+        # for that mask. Successive masks differ in only a few SNPs, so this matrix is cheaper to update than to
+        # recompute. The matrix is only needed when the PPI covariance matrix is formed explicitly, so it is allocated
+        # on first use. See _masked_xxt.
+        self._ppi_state = {'mask': np.zeros(self.P, dtype=bool), 'XXt': None}
+
+        # A cache used to hold the eigendecompositions of the Gram matrices of the included SNPs (and the projections
+        # of Y on their eigenvectors), from which we compute the marginal likelihood for any lambda and nu without
+        # forming the N x N PPI covariance matrix. See log_marg_like.
+        self._ppi_eig_cache = LRUCache(maxsize=8)
+
+        # The last (self.gamma, gamma0) pair seen by _mask, along with its bit-packed inclusion mask. Many consecutive
+        # likelihood evaluations (all of slice sampling lambda, for instance) are for the model's current gamma array.
+        self._mask_memo = (None, None, None)
 
         # Initialize the sparsity function by generating a random variate from the model's probit distribution
         self.gamma = self.probit_distribution(self.xi).rvs()
 
+    def __getstate__(self):
+        """
+        The state of this model for pickling (e.g. to hand the model to the worker processes of `run_mcmc_parallel`).
+        Cached values are recomputed on demand, so we leave out their (potentially very large) contents.
+        """
+        state = self.__dict__.copy()
+        # Recent versions of cachetools store the cached methods bound to this instance in its __dict__, under the
+        # names of the methods. These are recreated on first use.
+        for method in ('probit_distribution', '_ppi_from_mask', '_ppi_eig'):
+            state.pop(method, None)
+        for cache in ('_probit_cache', '_ppi_cache', '_ppi_eig_cache'):
+            state[cache] = LRUCache(maxsize=state[cache].maxsize)
+        state['_ppi_state'] = {'mask': np.zeros(self.P, dtype=bool), 'XXt': None}
+        state['_mask_memo'] = (None, None, None)
+        return state
+
     def _cache_key(self, *args):
         """
-        A unique key for given arguments args, useful for indexing into a cache. Each argument should either be
-        already hashable (e.g. a primitive Python types), or an ndarray (which we make hashable here)
+        A key for given arguments args, useful for indexing into a cache. Every cached method of this class takes
+        hashable arguments only (floats, and the bit-packed inclusion masks of SNPs as bytes objects), so the
+        arguments themselves make an exact key.
         """
-        return hash(tuple(hash(arg.data.tobytes()) if isinstance(arg, np.ndarray) else arg for arg in args))
+        return args
 
     @cachedmethod(cache=operator.attrgetter('_probit_cache'), key=_cache_key)
     def probit_distribution(self, xi):
@@ -127,9 +209,12 @@ class Probit:
         -------
         The normal distribution of the probits (`gamma`) of the model.
         """
-        return Mvn(cov=(xi * self.R.cov) + (1.0 - xi) * np.eye(self.P))
+        # xi * R + (1 - xi) * I, in a single pass over R and without allocating an identity matrix. The resulting
+        # matrix is owned by the (cached) distribution.
+        cov = xi * self.R.cov
+        cov.flat[::self.P + 1] += 1.0 - xi
+        return Mvn(cov=cov, check_finite=False)
 
-    @cachedmethod(cache=operator.attrgetter('_ppi_cache'), key=_cache_key)
     def ppi_distribution(self, gamma, gamma0, lamb):
         """
         Normal distribution for the posterior probability of inclusion.
@@ -189,9 +274,122 @@ class Probit:
         the probit threshold gamma0, and then simply taking the square of that masked matrix:
           X = X[:, gamma > gamma0]
           X * X.T
+
+        The distribution only depends on gamma through the set of SNPs it activates, so the computation is cached on
+        the (bit-packed) inclusion mask rather than on gamma itself. Successive values of gamma that activate the same
+        set of SNPs thus share a single distribution.
+        """
+        return self._ppi_from_mask(self._mask(gamma, gamma0)[0], lamb)
+
+    def _mask(self, gamma, gamma0):
+        """
+        The inclusion mask gamma > gamma0 of SNPs, bit-packed into a bytes object for use as a cache key, along with
+        the no. of SNPs included.
+
+        The result for the model's current gamma array (self.gamma) is remembered, and returned as-is when called
+        again with that same array object (and gamma0), without comparing or packing gamma again. The model never
+        modifies its gamma array in-place (every update assigns a new array), so identity implies unchanged contents.
+        Arrays handed in by callers may be modified between calls, and are always packed anew.
+        """
+        memo_gamma, memo_gamma0, result = self._mask_memo
+        if gamma is self.gamma and memo_gamma is gamma and memo_gamma0 == gamma0:
+            return result
+
+        mask = gamma > gamma0
+        result = np.packbits(mask).tobytes(), np.count_nonzero(mask)
+        if gamma is self.gamma:
+            self._mask_memo = gamma, gamma0, result
+        return result
+
+    def _unpack_mask(self, mask_bytes):
+        """
+        The boolean inclusion mask of SNPs from its bit-packed representation. See `_mask`.
+        """
+        return np.unpackbits(np.frombuffer(mask_bytes, dtype=np.uint8))[:self.P].astype(bool)
+
+    @cachedmethod(cache=operator.attrgetter('_ppi_cache'), key=_cache_key)
+    def _ppi_from_mask(self, mask_bytes, lamb):
+        """
+        Normal distribution for the posterior probability of inclusion, given the bit-packed inclusion mask of SNPs.
+        See `ppi_distribution`.
+        """
+        mask = self._unpack_mask(mask_bytes)
+
+        # (X[:, mask] X[:, mask]^T + 1_n 1_n^T) / lamb + I, without allocating all-ones or identity matrices
+        cov = self._masked_xxt(mask) + 1.0
+        cov /= lamb
+        cov.flat[::self.N + 1] += 1.0
+        return Mvn(cov=cov, check_finite=False)
+
+    def _masked_xxt(self, mask):
+        """
+        The N x N matrix X[:, mask] X[:, mask]^T for a boolean inclusion mask of SNPs.
+
+        Notes
+        -----
+        The matrix is a sum of rank-1 terms, one per included SNP:
+            X[:, mask] X[:, mask]^T = \\sum_{j \\in mask} X[:, j] X[:, j]^T
+
+        so rather than recomputing it, we update the matrix for the previous mask (kept in _ppi_state) by adding the
+        terms for newly included SNPs and subtracting the terms for excluded ones. Consecutive MCMC proposals only
+        change a handful of SNPs, which makes this an O(N^2 |changed|) instead of an O(N^2 |mask|) operation.
+        We recompute the matrix from scratch whenever the mask has changed in more places than it has SNPs, or when
+        it has not been computed yet.
+
+        The returned matrix is owned by _ppi_state, and will be modified by the next call to this method.
+        """
+        state = self._ppi_state
+        added, removed = mask & ~state['mask'], state['mask'] & ~mask
+        n_changed = np.count_nonzero(added) + np.count_nonzero(removed)
+
+        if state['XXt'] is None or n_changed >= np.count_nonzero(mask):
+            if state['XXt'] is None:
+                state['XXt'] = np.empty((self.N, self.N))
+            X = self.X[:, mask]
+            np.matmul(X, X.T, out=state['XXt'])
+        elif n_changed > 0:
+            X = self.X[:, added]
+            state['XXt'] += np.dot(X, X.T)
+            X = self.X[:, removed]
+            state['XXt'] -= np.dot(X, X.T)
+
+        state['mask'] = mask
+        return state['XXt']
+
+    def _ppi_gram(self, mask_bytes):
+        """
+        The k x k Gram matrix B^T B and the k-vector B^T Y, where B = [X[:, mask], 1_n] is the N x k matrix of included
+        SNPs, augmented with a column of ones. See `log_marg_like`.
+
+        The products involving 1_n and Y are indexed from X^T 1_n and X^T Y precomputed in the constructor. Only the
+        block X[:, mask]^T X[:, mask] is computed here, in O(N k^2) time, comparable to the eigendecomposition of the
+        Gram matrix that follows (see `_ppi_eig`). Precomputing all of X^T X would instead take O(P^2) memory.
+        """
+        mask = self._unpack_mask(mask_bytes)
+        k = np.count_nonzero(mask) + 1
+
+        X = self.X[:, mask]
+        G = np.empty((k, k))
+        np.matmul(X.T, X, out=G[:-1, :-1])
+        G[:-1, -1] = G[-1, :-1] = self._Xt1[mask]
+        G[-1, -1] = self.N
+
+        BtY = np.empty(k)
+        BtY[:-1] = self._XtY[mask]
+        BtY[-1] = np.sum(self.Y)
+
+        return G, BtY
+
+    @cachedmethod(cache=operator.attrgetter('_ppi_eig_cache'), key=_cache_key)
+    def _ppi_eig(self, mask_bytes):
         """
-        X = self.X[:, gamma > gamma0]
-        return Mvn(cov=(np.dot(X, X.T) + np.ones((self.N, self.N))) / lamb + np.eye(self.N))
+        The eigenvalues w of the Gram matrix B^T B = Q diag(w) Q^T (see `_ppi_gram`), along with the projection
+        Q^T B^T Y. See `log_marg_like`.
+        """
+        G, BtY = self._ppi_gram(mask_bytes)
+        w, Q = scipy.linalg.eigh(G, check_finite=False)
+        # B^T B is positive semi-definite; guard against round-off producing slightly negative eigenvalues
+        return np.maximum(w, 0), np.dot(Q.T, BtY)
 
     def log_marg_like(self, gamma, gamma0, lamb, nu):
         r"""
@@ -213,8 +411,50 @@ class Probit:
         float
             A scalar log-likelihood value of the model, given the model parameters (and the true Y values stored in
             this model object).
+
+        Notes
+        -----
+        The PPI covariance matrix (see `ppi_distribution`) is a low-rank update of the identity:
+
+        .. math::
+
+            \nu^{-1}(I_n + \lambda^{-1} B B^T), \quad B = [X_\Gamma, 1_n]
+
+        where :math:`X_\Gamma` holds the k-1 included columns of X. When k is smaller than N, we avoid the N x N
+        matrix (and its Cholesky decomposition) altogether, using the Woodbury identity and the matrix determinant
+        lemma on the k x k matrix :math:`\lambda I_k + B^T B`:
+
+        .. math::
+
+            y^T (I_n + \lambda^{-1} B B^T)^{-1} y = y^T y - (B^T y)^T (\lambda I_k + B^T B)^{-1} (B^T y)
+
+            \log |I_n + \lambda^{-1} B B^T| = \log |\lambda I_k + B^T B| - k \log \lambda
+
+        With the eigendecomposition :math:`B^T B = Q diag(w) Q^T`, and :math:`t = Q^T B^T y`, these become sums over
+        the k eigenvalues:
+
+        .. math::
+
+            y^T y - \sum_i \frac{t_i^2}{\lambda + w_i}, \quad \sum_i \log (1 + w_i / \lambda)
+
+        The eigendecomposition only depends on the inclusion mask, and is cached. All evaluations for the same mask
+        (in particular, all those made while slice sampling lambda) then cost O(k), instead of O(N^3).
         """
-        return self.ppi_distribution(gamma, gamma0, lamb).logpdf(self.Y, precision_multiplier=nu)
+        log_pdet, maha = self._ppi_terms(gamma, gamma0, lamb)
+        return -0.5 * (self.N * (_LOG_2PI - np.log(nu)) + log_pdet + nu * maha)
+
+    def _ppi_terms(self, gamma, gamma0, lamb):
+        """
+        The log-determinant of the PPI covariance matrix I_n + (1_n 1_n^T + X[:, mask] X[:, mask]^T) / lamb,
+        and the Mahalanobis distance of Y under it, computed from cached per-mask quantities. See `log_marg_like`.
+        """
+        mask_bytes, n_included = self._mask(gamma, gamma0)
+        if n_included + 1 >= self.N:
+            ppi_distribution = self._ppi_from_mask(mask_bytes, lamb)
+            return ppi_distribution.cov_info.log_pdet, ppi_distribution.maha(self.Y)
+
+        w, t = self._ppi_eig(mask_bytes)
+        return np.sum(np.log1p(w / lamb)), self._yy - np.sum(t * t / (lamb + w))
 
     def log_joint(self):
         r"""
@@ -226,14 +466,18 @@ class Probit:
             A scalar joint log-likelihood value of the entire model, given the model parameters and the true Y values
             stored in this model object.
         """
-        return sum([
-            self.log_marg_like(self.gamma, self.gamma0, self.lamb, self.nu),
-            self._gamma0_distribution.logpdf(self.gamma0),
-            self._nu_distribution.logpdf(self.nu),
-            self._lambda_distribution.logpdf(self.lamb),
-            self.probit_distribution(self.xi).logpdf(self.gamma),
-            self._xi_distribution.logpdf(self.xi) if self.sample_xi else 0.0
-        ])
+        return self.log_marg_like(self.gamma, self.gamma0, self.lamb, self.nu) + self._log_prior()
+
+    def _log_prior(self):
+        """
+        The sum of the prior log-density values of the current model parameters.
+        """
+        return (
+            self._gamma0_distribution.logpdf(self.gamma0) +
+            self._nu_distribution.logpdf(self.nu) +
+            self._lambda_distribution.logpdf(self.lamb) +
+            self.probit_distribution(self.xi).logpdf(self.gamma)
+        )
 
     def run_mcmc(self, iters=1000, burn_in=100, detailed=False):
         r"""
@@ -258,7 +502,11 @@ class Probit:
         """
         logjoint_trace = np.zeros(iters)
         if detailed:
-            inclusion_trace = np.zeros((iters, self.P), dtype=bool)
+            # Rather than a trace of inclusion masks, we only keep what we report: the no. of iterations each SNP
+            # was included in, and the mask of the iteration with the highest joint log-likelihood value.
+            inclusion = np.empty(self.P, dtype=bool)
+            inclusion_count = np.zeros(self.P, dtype=int)
+            inclusion_best, log_joint_best = None, None
             gamma0_trace = np.zeros(iters)
             lambda_trace = np.zeros(iters)
             nu_trace = np.zeros(iters)
@@ -266,8 +514,8 @@ class Probit:
             loglike_trace = np.zeros(iters)
 
         for i in range(-burn_in, iters):
-            log_joint = self.log_joint()
             log_like = self.log_marg_like(self.gamma, self.gamma0, self.lamb, self.nu)
+            log_joint = log_like + self._log_prior()
 
             logger.info(
                 '%05d / %05d] logprob: %f [gamma0:%f lambda:%f nu:%f xi:%f' %
@@ -279,7 +527,10 @@ class Probit:
             if i >= 0:
                 logjoint_trace[i] = log_joint
                 if detailed:
-                    inclusion_trace[i, :] = self.gamma > self.gamma0
+                    np.greater(self.gamma, self.gamma0, out=inclusion)
+                    inclusion_count += inclusion
+                    if inclusion_best is None or log_joint > log_joint_best:
+                        inclusion_best, log_joint_best = inclusion.copy(), log_joint
                     gamma0_trace[i] = self.gamma0
                     lambda_trace[i] = self.lamb
                     nu_trace[i] = self.nu
@@ -290,7 +541,7 @@ class Probit:
             return logjoint_trace
         else:
             return {
-                'inclusion': (np.mean(inclusion_trace, 0), inclusion_trace[np.argmax(logjoint_trace), :]),
+                'inclusion': (inclusion_count / iters, inclusion_best),
                 'gamma0': gamma0_trace,
                 'lambda': lambda_trace,
                 'nu': nu_trace,
@@ -299,21 +550,51 @@ class Probit:
                 'likelihood': loglike_trace
             }
 
+    def run_mcmc_parallel(self, n_chains=4, iters=1000, burn_in=100, detailed=False, seeds=None):
+        r"""
+        Execute several independent runs of MCMC on this model in parallel, one per process, each starting from the
+        current state of model parameters. The state of this model object is not modified.
+
+        Parameters
+        ----------
+        n_chains : int, optional
+            The no. of MCMC chains to run.
+        iters : int
+            The total no. of iterations (excluding the burn-in) to run the MCMC simulations.
+        burn_in : int
+            The total no. of burn-in iterations of the MCMC simulation.
+        detailed : bool, optional
+            Whether to return a detailed trace of individual model parameters, or a trace of the joint log-likelihood
+            value.
+        seeds : list, optional
+            The random seeds to use for the chains, one per chain. If None (the default), seeds are drawn from
+            numpy's global random number generator.
+
+        Returns
+        -------
+        list
+            A list of n_chains traces, each as returned by `run_mcmc`.
+        """
+        if seeds is None:
+            seeds = np.random.randint(2 ** 31, size=n_chains)
+        assert len(seeds) == n_chains, "Expected one seed per chain"
+
+        with multiprocessing.Pool(n_chains) as pool:
+            return pool.map(_run_chain, [(self, seed, iters, burn_in, detailed) for seed in seeds])
+
     def update_parameters(self):
         r"""
         Update all model parameters in a single MCMC step.
 
         Returns
         -------
-        On return, the gamma, gamma0, lambda, nu and optionally the `xi` model parameter have been updated.
+        On return, the gamma, gamma0, lambda and nu model parameters have been updated.
         """
         # We update gamma, gamma0, lambda and nu in turn (Bottolo et al, 2011)
         self.update_gamma()
         self.update_gamma0()
         self.update_lambda()
         self.update_nu()
-        if self.sample_xi:
-            self.update_xi()
 
     def update_gamma(self):
         r"""
@@ -364,13 +645,11 @@ class Probit:
 
             b_\nu^{(n)} = b_\nu + \frac{1}{2} y^T (\lambda^{-1} (1_n 1_n^T + X \Gamma X^T) + I_n)^{-1} y
         """
-        ppi_distribution = self.ppi_distribution(self.gamma, self.gamma0, self.lamb)
-
-        distance_sq = ppi_distribution.maha(self.Y)
-        post_a = self.nu_a + 0.5 * self.N
+        # The Mahalanobis distance shares the cached factorization that log_marg_like uses for the same parameters
+        _, distance_sq = self._ppi_terms(self.gamma, self.gamma0, self.lamb)
         post_b = self.nu_b + 0.5 * distance_sq
 
-        self.nu = np.random.gamma(post_a, 1 / post_b)
+        self.nu = np.random.gamma(self._nu_post_a, 1 / post_b)
 
     def update_lambda(self):
         r"""
@@ -386,10 +665,14 @@ class Probit:
         density of :math:`\lambda` does not have a simple closed form, but can be efficiently sampled using the
         exponential-expansion slice sampling algorithm described in :cite:`Neal2003`
         """
+        # Everything but lambda stays fixed while slice sampling, so we look it up once, outside of slice_fn
+        log_marg_like, gamma, gamma0, nu = self.log_marg_like, self.gamma, self.gamma0, self.nu
+        log_prior = self._lambda_distribution.logpdf
+
         def slice_fn(lamb):
             if lamb < 0:
                 return -np.inf
-            return self.log_marg_like(self.gamma, self.gamma0, lamb, self.nu) + self._lambda_distribution.logpdf(lamb)
+            return log_marg_like(gamma, gamma0, lamb, nu) + log_prior(lamb)
 
         self.lamb = SliceSampler(slice_fn).one(x0=self.lamb)
 
@@ -408,8 +691,12 @@ class Probit:
         density of :math:`\gamma_0` does not have a simple closed form, but can be efficiently sampled using the
         exponential-expansion slice sampling algorithm described in :cite:`Neal2003`
         """
+        # Everything but gamma0 stays fixed while slice sampling, so we look it up once, outside of slice_fn
+        log_marg_like, gamma, lamb, nu = self.log_marg_like, self.gamma, self.lamb, self.nu
+        log_prior = self._gamma0_distribution.logpdf
+
         def slice_fn(gamma0):
-            return self.log_marg_like(self.gamma, gamma0, self.lamb, self.nu) + self._gamma0_distribution.logpdf(gamma0)
+            return log_marg_like(gamma, gamma0, lamb, nu) + log_prior(gamma0)
 
         self.gamma0 = SliceSampler(slice_fn).one(x0=self.gamma0)
 
@@ -421,21 +708,66 @@ class Probit:
         Returns
         -------
         On return, the :math:`\xi` parameter of the model has been updated using a new sample.
+
+        Notes
+        -----
+        We slice sample :math:`\xi` keeping the whitened latent variables fixed :cite:`Murray2010b`. With the
+        eigendecomposition :math:`R = V diag(w) V^T` computed in the constructor, the probit covariance matrix is
+
+        .. math::
+
+            \xi R + (1 - \xi) I = V diag(\xi w + 1 - \xi) V^T
+
+        so :math:`V diag(\xi w + 1 - \xi)^{1/2}` is a square root of it for every :math:`\xi`. Whitening and
+        correlating thus reduce to elementwise scalings in the eigenbasis, instead of a new Cholesky decomposition of a
+        P x P matrix for each value of :math:`\xi` visited by the slice sampler.
         """
+        w, V = self._R_eigvals, self._R_eigvecs
+        w_min = w[0]
 
         # Compute the latent whitened variables
-        whitened = self.probit_distribution(self.xi).whiten(self.gamma)
+        whitened = np.dot(V.T, self.gamma) / np.sqrt(self.xi * w + (1.0 - self.xi))
 
-        def slice_fn(xi):
-            if xi <= 0 or xi >= 1:
-                return -np.inf
+        def correlate(xi):
+            return np.dot(V, whitened * np.sqrt(xi * w + (1.0 - xi)))
 
-            try:
-                gamma = self.probit_distribution(xi).correlate(whitened)
-            except np.linalg.linalg.LinAlgError:
+        def slice_fn(xi):
+            # Outside (0, 1), or for values of xi where the covariance matrix is not positive definite
+            if xi <= 0 or xi >= 1 or xi * w_min + (1.0 - xi) <= 0:
                 return -np.inf
-            else:
-                return self.log_marg_like(gamma, self.gamma0, self.lamb, self.nu) + self._xi_distribution.logpdf(xi)
+            return self.log_marg_like(correlate(xi), self.gamma0, self.lamb, self.nu) + self._xi_distribution.logpdf(xi)
 
         self.xi = SliceSampler(slice_fn).one(x0=self.xi)
-        self.gamma = self.probit_distribution(self.xi).correlate(whitened)
+        self.gamma = correlate(self.xi)
+
+
+class ProbitSampleXi(Probit):
+    """
+    The Probit model, where the shrinkage factor xi is sampled along with the other model parameters.
+    Created by instantiating a `Probit` model with xi=None, or directly with the same arguments as `Probit`, except
+    for xi, which should not be specified.
+    """
+    sample_xi = True
+
+    def __init__(self, *args, **kwargs):
+        arguments = inspect.signature(Probit.__init__).bind(self, *args, **kwargs)
+        assert arguments.arguments.get('xi') is None, "xi is sampled, and should not be specified"
+        arguments.arguments['xi'] = None
+        super().__init__(*arguments.args[1:], **arguments.kwargs)
+
+    def _log_prior(self):
+        """
+        The sum of the prior log-density values of the current model parameters, including xi.
+        """
+        return super()._log_prior() + self._xi_distribution.logpdf(self.xi)
+
+    def update_parameters(self):
+        r"""
+        Update all model parameters in a single MCMC step.
+
+        Returns
+        -------
+        On return, the gamma, gamma0, lambda, nu and `xi` model parameters have been updated.
+        """
+        super().update_parameters()
+        self.update_xi()
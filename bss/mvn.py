@@ -18,6 +18,8 @@ class Mvn:
        The dx1 mean vector of the normal distribution. Assumed 0 if not specified.
     cov : ndarray
        The dxd covariance matrix. Assumed the Identity matrix if not specified.
+       Neither the mean vector nor the covariance matrix are copied, and they should not be modified after the
+       distribution is constructed.
     min_eigenval : float, optional
        The minimum eigenvalue of the covariance matrix we're willing to accept. All values below this threshold
        are set to this value. If None (the default), no eignvalues are adjusted.
@@ -29,16 +31,16 @@ class Mvn:
     def __init__(self, mean=None, cov=None, min_eigenval=None, jitter=None, check_finite=True):
         assert mean is not None or cov is not None, "At least one of mean or cov must be specified"
         if mean is None:
-            cov = np.array(cov)
+            cov = np.asarray(cov)
             self.d = cov.shape[0]
             mean = np.zeros(self.d)
         elif cov is None:
-            mean = np.array(mean)
+            mean = np.asarray(mean)
             self.d = mean.shape[0]
             cov = np.eye(self.d)
 
-        mean = np.array(mean)
-        cov = np.array(cov)
+        mean = np.asarray(mean)
+        cov = np.asarray(cov)
 
         assert cov.ndim == 2, "Covariance matrix not 2D"
         assert cov.shape[0] == cov.shape[1], "Covariance matrix not square"
@@ -92,8 +94,8 @@ class Mvn:
             A scalar distance value between x and the mean of this distribution
         """
         dev = x - self.mean
-        solve = scipy.linalg.solve_triangular(self.chol/np.sqrt(precision_multiplier), dev, lower=True, trans=0)
-        return np.dot(solve.T, solve)
+        solve = scipy.linalg.solve_triangular(self.chol, dev, lower=True, trans=0, check_finite=self.check_finite)
+        return precision_multiplier * np.dot(solve.T, solve)
 
     def logpdf(self, x, precision_multiplier=1):
         """
@@ -14,7 +14,8 @@ class SliceSampler:
     Parameters
     ----------
     logprob : callable
-        A function taking a single sample (a dx1 ndarray), and returning the log-probability of that sample
+        A function taking a single sample (a dx1 ndarray), and returning the log-probability of that sample.
+        If sampling is started from a scalar x0, the function is handed each sample as a float instead.
     w : float, optional
         Estimate of the typical size of a slice
     expand : bool, optional
@@ -147,7 +148,14 @@ class _SliceSamplerIterator:
         Log-probability value from a sample that is |z| distance away from the d-dimensional point x0, in the
         direction specified by the axis-aligned 'direction' (a vector with exactly one 1 and d-1 0s)
         """
-        return self.logprob(self.x0 + direction * z)
+        return self.point_logprob(self.x0 + direction * z)
+
+    def point_logprob(self, x):
+        """
+        Log-probability value at the d-dimensional point x. When sampling a scalar, the log-probability function is
+        handed a plain float instead of a 1-element array, as it was started with.
+        """
+        return self.logprob(float(x[0]) if self.scalar else x)
 
     def acceptable(self, x0, x1, y, L, R, direction):
         """
@@ -196,7 +204,7 @@ class _SliceSamplerIterator:
         # Log-Likelihood value at x0
         # Note that the height of the slice, y = prob(x0) * npr.rand()
         # In the log-probability space that we're dealing with, this translates to:
-        y = self.logprob(x0) + np.log(npr.rand())
+        y = self.point_logprob(x0) + np.log(npr.rand())
 
         # The no. of "step-out" steps we've taken in the lower and upper directions
         L_steps_out = R_steps_out = 0
@@ -0,0 +1,168 @@
+"""
+Univariate distributions for the scalar parameters of our models.
+
+These mirror the small subset of the scipy.stats frozen distribution interface that we need (mean, logpdf, rvs), but
+are meant to be evaluated on one scalar at a time, many times over. For scalar inputs, the argument checking and
+broadcasting machinery of scipy.stats costs an order of magnitude more than the arithmetic itself. Here, we
+precompute all normalizing constants in the constructor and evaluate the densities with the math module.
+"""
+
+import math
+import numpy as np
+
+_LOG_2PI = math.log(2 * math.pi)
+
+
+class Normal:
+    """A normal random variable.
+
+    Parameters
+    ----------
+    loc : float, optional
+        The mean of the distribution.
+    scale : float, optional
+        The standard deviation of the distribution.
+    """
+    def __init__(self, loc=0.0, scale=1.0):
+        self.loc = loc
+        self.scale = scale
+        self._log_norm = -0.5 * _LOG_2PI - math.log(scale)
+
+    def mean(self):
+        """
+        Returns
+        -------
+        float
+            The mean of this distribution
+        """
+        return self.loc
+
+    def logpdf(self, x):
+        """
+        Calculate the Log Probability Density Function value at a given scalar x.
+
+        Parameters
+        ----------
+        x : float
+            The value for which we wish to calculate the log PDF value
+
+        Returns
+        -------
+        float
+            The Log PDF value at x
+        """
+        z = (x - self.loc) / self.scale
+        return self._log_norm - 0.5 * z * z
+
+    def rvs(self):
+        """
+        Returns
+        -------
+        float
+            A single random variate from this distribution
+        """
+        return np.random.normal(self.loc, self.scale)
+
+
+class Gamma:
+    """A gamma random variable.
+
+    Parameters
+    ----------
+    a : float
+        The shape parameter of the distribution.
+    b : float, optional
+        The inverse-scale (rate) parameter of the distribution.
+    """
+    def __init__(self, a, b=1.0):
+        self.a = a
+        self.b = b
+        self._log_norm = a * math.log(b) - math.lgamma(a)
+
+    def mean(self):
+        """
+        Returns
+        -------
+        float
+            The mean of this distribution
+        """
+        return self.a / self.b
+
+    def logpdf(self, x):
+        """
+        Calculate the Log Probability Density Function value at a given scalar x.
+
+        Parameters
+        ----------
+        x : float
+            The value for which we wish to calculate the log PDF value
+
+        Returns
+        -------
+        float
+            The Log PDF value at x, or -inf if x is outside the support of the distribution
+        """
+        if x <= 0:
+            return -np.inf
+        return (self.a - 1) * math.log(x) - self.b * x + self._log_norm
+
+    def rvs(self):
+        """
+        Returns
+        -------
+        float
+            A single random variate from this distribution
+        """
+        return np.random.gamma(self.a, 1 / self.b)
+
+
+class Beta:
+    """A beta random variable.
+
+    Parameters
+    ----------
+    a : float
+        The first shape parameter of the distribution.
+    b : float
+        The second shape parameter of the distribution.
+    """
+    def __init__(self, a, b):
+        self.a = a
+        self.b = b
+        self._log_norm = math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b)
+
+    def mean(self):
+        """
+        Returns
+        -------
+        float
+            The mean of this distribution
+        """
+        return self.a / (self.a + self.b)
+
+    def logpdf(self, x):
+        """
+        Calculate the Log Probability Density Function value at a given scalar x.
+
+        Parameters
+        ----------
+        x : float
+            The value for which we wish to calculate the log PDF value
+
+        Returns
+        -------
+        float
+            The Log PDF value at x, or -inf if x is outside the open interval (0, 1)
+        """
+        if x <= 0 or x >= 1:
+            return -np.inf
+        return (self.a - 1) * math.log(x) + (self.b - 1) * math.log1p(-x) + self._log_norm
+
+    def rvs(self):
+        """
+        Returns
+        -------
+        float
+            A single random variate from this distribution
+        """
+        return np.random.beta(self.a, self.b)
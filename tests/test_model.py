@@ -1,8 +1,11 @@
 import os.path
+import copy
+import pickle
 import numpy as np
 from unittest import TestCase
 
-from bss.models.probit import Probit
+from bss.models.probit import Probit, ProbitSampleXi
+from bss.mvn import Mvn
 from bss.data import load_data
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'sample_data')
@@ -26,6 +29,7 @@ class ModelTestCase(TestCase):
             Y=self.y,
             R=self.R
         )
+        self.assertIs(type(model), Probit)
         trace = model.run_mcmc(burn_in=5, iters=10)
         expected_trace = [
             4613.3151614505305, 4700.0565201187101, 4651.464728613646, 4654.9619244943506, 4628.7974616871106,
@@ -42,10 +46,11 @@ class ModelTestCase(TestCase):
             R=self.R,
             xi=None
         )
+        self.assertIsInstance(model, ProbitSampleXi)
         trace = model.run_mcmc(burn_in=5, iters=10)
         expected_trace = [
-            -2712.1243232190068, -2816.0395965482576, -2827.3281565130937, -1582.3140750335701, -2805.4378869844559,
-            -2837.8348894101946, -2864.5580147460505, -2484.2768900178071, -2382.4815505858278, -2796.0928580805762
+            -2804.829017499155, -2304.593717311494, -2714.599163722022, -2707.906920848748, -1860.9471183772075,
+            -1672.6232450659968, -1344.2986397325749, -1538.107200182641, -2177.361394694838, -1223.450982911515
         ]
         self.assertEqual(len(trace), len(expected_trace))
         for x, y in zip(trace, expected_trace):
@@ -62,31 +67,277 @@ class ModelTestCase(TestCase):
 
         expected = {
             'joint': [
-                -2712.1243232190068, -2816.0395965482576, -2827.3281565130937, -1582.3140750335701, -2805.4378869844559,
-                -2837.8348894101946, -2864.5580147460505, -2484.2768900178071, -2382.4815505858278, -2796.0928580805762
+                -2804.829017499155, -2304.593717311494, -2714.599163722022, -2707.906920848748, -1860.9471183772075,
+                -1672.6232450659968, -1344.2986397325749, -1538.107200182641, -2177.361394694838, -1223.450982911515
             ],
             'likelihood': [
-                -684.06472998, -682.95231508, -682.53844185, -681.25566689, -680.87534291,
-                -680.64811811, -681.42748042, -680.54291735, -680.97633156, -680.45279408
+                -680.82298289, -682.7929791, -682.70000904, -682.47855097, -686.37052974,
+                -680.70460995, -681.49647945, -681.08652798, -682.24941213, -680.70149876
             ],
             'xi': [
-                0.04826542, 0.04400981, 0.85999135, 0.13222765, 0.04636762, 0.07791028,
-                0.44413487, 0.55616501, 0.10905116, 0.634995
+                0.5981472, 0.2378053, 0.21519594, 0.80150241, 0.84164001, 0.90519958,
+                0.87051075, 0.68015675, 0.92204065, 0.65771601
             ],
             'nu': [
-                1.03414633, 1.00874212, 0.98707078, 1.03425261, 0.97088564,
-                1.08444457, 1.02924025, 0.93905739, 1.00373751, 1.07782064
+                1.10313229, 0.97178505, 1.08376073, 0.80500657, 1.03711304,
+                0.92493144, 0.96105841, 1.09848297, 1.04709417, 0.92158998
             ],
             'gamma0': [
-                4.53206381, 4.20932857, 4.0223458, 4.63599829, 2.78279365,
-                1.52285834, 2.99568083, 3.42461735, 3.36309594, 2.48723791
+                3.37270067, 3.77436682, 3.00230691, 2.83832936, 3.91020793,
+                2.63677829, 2.68923367, 3.24314513, 4.97511713, 3.54209184
             ],
             'lambda': [
-                4.03646936e+00, 7.44532960e+00, 1.26766841e+02, 5.45426416e+02, 6.34643878e+03,
-                21230.900822630727, 13882.875127113773, 8300.9957627273707, 25404.505387005316, 98950.409313213691
+                45.77297560621481, 6.734620022954111, 39.28125561233674, 394.1896599671704, 1719.2862968043223,
+                1482.4580637705521, 693.8698333318034, 439.205271213007, 7846.960279104985, 1122.968122570489
             ]
         }
 
         for k, v in expected.items():
             for x, y in zip(detailed_trace[k], v):
                 self.assertAlmostEqual(x, y, places=6)
+
+        inclusion_mean, inclusion_best = detailed_trace['inclusion']
+        self.assertEqual(inclusion_mean.shape, (self.X.shape[1],))
+        self.assertTrue(np.all((inclusion_mean >= 0) & (inclusion_mean <= 1)))
+        self.assertEqual(inclusion_best.shape, (self.X.shape[1],))
+        self.assertEqual(inclusion_best.dtype, bool)
+
+    def test_model_parallel(self):
+        X, y, R = load_data(os.path.join(DATA_DIR, 'real0_*_100.out'))
+        model = Probit(X=X, Y=y, R=R)
+
+        traces = model.run_mcmc_parallel(n_chains=2, burn_in=2, iters=5, seeds=[1, 2])
+        self.assertEqual(len(traces), 2)
+        self.assertFalse(np.allclose(traces[0], traces[1]))
+
+        # Each chain is the same as a serial run with the same seed, from the same starting state
+        for seed, trace in zip([1, 2], traces):
+            serial_model = copy.deepcopy(model)
+            np.random.seed(seed)
+            expected_trace = serial_model.run_mcmc(burn_in=2, iters=5)
+            self.assertEqual(len(trace), len(expected_trace))
+            for x, y in zip(trace, expected_trace):
+                self.assertAlmostEqual(x, y, places=6)
+
+    def test_model_masked_xxt(self):
+        model = Probit(X=self.X, Y=self.y, R=self.R)
+        self.assertIsNone(model._ppi_state['XXt'])
+
+        # Sets of included SNPs in the order visited, exercising both the incremental updates and the full rebuilds
+        P = self.X.shape[1]
+        masks = []
+        for included in (
+            range(10),                          # from empty: rebuilt
+            list(range(10)) + [10, 11],         # add only
+            list(range(3, 10)) + [10, 11],      # remove only
+            list(range(5, 10)) + [11, 20, 21],  # mixed
+            range(30, 35),                      # more changes than included SNPs: rebuilt
+            range(31, 35),                      # remove only, after a rebuild
+            [],                                 # back to empty
+        ):
+            mask = np.zeros(P, dtype=bool)
+            mask[list(included)] = True
+            masks.append(mask)
+
+        for mask in masks:
+            X = self.X[:, mask]
+            self.assertTrue(np.allclose(model._masked_xxt(mask), X @ X.T))
+
+        # The same, through the public ppi_distribution, where SNPs are included through gamma > gamma0
+        lamb = 2.0
+        for mask in masks:
+            gamma = np.where(mask, 1.0, -1.0)
+            X = self.X[:, mask]
+            expected_cov = (X @ X.T + 1.0) / lamb + np.eye(self.X.shape[0])
+            self.assertTrue(np.allclose(model.ppi_distribution(gamma, 0.0, lamb).cov, expected_cov))
+
+    def _small_model(self, N=20, P=60):
+        """
+        A small model with more SNPs than samples, so that masks can include as many SNPs as there are samples, or
+        more.
+        """
+        rng = np.random.RandomState(0)
+        X = rng.randn(N, P)
+        y = rng.randn(N)
+        return Probit(X=X, Y=y, R=np.eye(P))
+
+    def _dense_log_marg_like(self, model, mask, lamb, nu):
+        """
+        The marginal likelihood log-value from the explicitly formed N x N PPI covariance matrix.
+        """
+        X = model.X[:, mask]
+        cov = (X @ X.T + np.ones((model.N, model.N))) / lamb + np.eye(model.N)
+        return Mvn(cov=cov).logpdf(model.Y, precision_multiplier=nu)
+
+    def test_model_log_marg_like(self):
+        model = self._small_model()
+        nu = 1.7
+        for k in (0, 5, model.N - 1, model.N, 2 * model.N):
+            mask = np.zeros(model.P, dtype=bool)
+            mask[:k] = True
+            gamma = np.where(mask, 1.0, -1.0)
+            for lamb in (1e-3, 1.0, 1e3):
+                self.assertAlmostEqual(
+                    model.log_marg_like(gamma, 0.0, lamb, nu),
+                    self._dense_log_marg_like(model, mask, lamb, nu),
+                    places=6
+                )
+
+    def test_model_ppi_eig(self):
+        model = self._small_model()
+        # Duplicated columns make the Gram matrices of masks including both copies rank-deficient
+        model.X[:, 1::2] = model.X[:, ::2]
+        model._Xt1, model._XtY = np.sum(model.X, axis=0), model.X.T @ model.Y
+
+        nu = 1.7
+        for k in (2, 10, model.N, 2 * model.N):
+            mask = np.zeros(model.P, dtype=bool)
+            mask[:k] = True
+            mask_bytes = np.packbits(mask).tobytes()
+
+            # The Gram matrix of [X[:, mask], 1_n]
+            B = np.column_stack([model.X[:, mask], np.ones(model.N)])
+            G, BtY = model._ppi_gram(mask_bytes)
+            self.assertTrue(np.allclose(G, B.T @ B))
+            self.assertTrue(np.allclose(BtY, B.T @ model.Y))
+
+            # The eigenvalues are clamped at 0, and the O(k) formulas hold however rank-deficient the Gram matrix is
+            w, t = model._ppi_eig(mask_bytes)
+            self.assertTrue(np.all(w >= 0))
+            for lamb in (1e-3, 1.0, 1e3):
+                log_pdet = np.sum(np.log1p(w / lamb))
+                maha = model._yy - np.sum(t * t / (lamb + w))
+                self.assertAlmostEqual(
+                    -0.5 * (model.N * (np.log(2 * np.pi) - np.log(nu)) + log_pdet + nu * maha),
+                    self._dense_log_marg_like(model, mask, lamb, nu),
+                    places=6
+                )
+
+    def test_model_log_marg_like_modified_gamma(self):
+        model = self._small_model()
+        gamma = -np.ones(model.P)
+        gamma[:5] = 1.0
+        mask = gamma > 0.0
+        self.assertAlmostEqual(
+            model.log_marg_like(gamma, 0.0, 1.0, 1.0), self._dense_log_marg_like(model, mask, 1.0, 1.0), places=6
+        )
+
+        # Modifying gamma in-place changes the SNPs included
+        gamma[5:10] = 1.0
+        mask = gamma > 0.0
+        self.assertAlmostEqual(
+            model.log_marg_like(gamma, 0.0, 1.0, 1.0), self._dense_log_marg_like(model, mask, 1.0, 1.0), places=6
+        )
+
+    def test_model_pickle(self):
+        X, y, R = load_data(os.path.join(DATA_DIR, 'real0_*_100.out'))
+        model = Probit(X=X, Y=y, R=R)
+        model.run_mcmc(burn_in=0, iters=2)
+        model.ppi_distribution(model.gamma, model.gamma0, model.lamb)
+        self.assertIsNotNone(model._ppi_state['XXt'])
+
+        # Cached values are left out of the pickled state, including the N x N matrix kept by _masked_xxt
+        N = X.shape[0]
+        data = pickle.dumps(model)
+        self.assertLess(len(data), 8 * N * N)
+
+        unpickled = pickle.loads(data)
+        self.assertIsNone(unpickled._ppi_state['XXt'])
+        self.assertEqual(len(unpickled._ppi_eig_cache), 0)
+        self.assertAlmostEqual(unpickled.log_joint(), model.log_joint(), places=6)
+        self.assertTrue(np.allclose(
+            unpickled.ppi_distribution(model.gamma, model.gamma0, model.lamb).cov,
+            model.ppi_distribution(model.gamma, model.gamma0, model.lamb).cov
+        ))
+
+    def test_model_sample_xi_direct(self):
+        rng = np.random.RandomState(0)
+        X, y = rng.randn(20, 10), rng.randn(20)
+
+        model = ProbitSampleXi(X=X, Y=y, R=np.eye(10))
+        self.assertTrue(model.sample_xi)
+        self.assertEqual(model.xi, 0.5)
+        model.update_parameters()
+        self.assertTrue(0 < model.xi < 1)
+
+        # The same model, through Probit
+        model = Probit(X, y, np.eye(10), xi=None)
+        self.assertIs(type(model), ProbitSampleXi)
+        self.assertTrue(model.sample_xi)
+        model.update_parameters()
+
+        self.assertFalse(Probit(X, y, np.eye(10)).sample_xi)
+        with self.assertRaises(AssertionError):
+            ProbitSampleXi(X, y, np.eye(10), xi=0.5)
+
+    def test_model_detailed_inclusion(self):
+        rng = np.random.RandomState(0)
+        model = Probit(X=rng.randn(20, 10), Y=rng.randn(20), R=np.eye(10), target_sparsity=0.3)
+        reference_model = copy.deepcopy(model)
+
+        np.random.seed(2)
+        inclusion_mean, inclusion_best = model.run_mcmc(burn_in=2, iters=20, detailed=True)['inclusion']
+
+        # The same chain, keeping the full trace of inclusion masks
+        np.random.seed(2)
+        log_joints, masks = [], []
+        for i in range(-2, 20):
+            log_joint = reference_model.log_joint()
+            reference_model.update_parameters()
+            if i >= 0:
+                log_joints.append(log_joint)
+                masks.append(reference_model.gamma > reference_model.gamma0)
+
+        self.assertTrue(np.allclose(inclusion_mean, np.mean(masks, 0)))
+        self.assertTrue(np.array_equal(inclusion_best, masks[np.argmax(log_joints)]))
+
+    def test_model_xi_eigenbasis(self):
+        X, y, R = load_data(os.path.join(DATA_DIR, 'real0_*_100.out'))
+        model = Probit(X=X, Y=y, R=R, xi=None)
+        w, V = model._R_eigvals, model._R_eigvecs
+
+        for xi in (0.01, 0.5, 0.9, 0.999999):
+            # V diag(xi * w + 1 - xi)^(1/2) is a square root of the probit covariance matrix
+            L = V * np.sqrt(xi * w + 1.0 - xi)
+            self.assertTrue(np.allclose(L @ L.T, model.probit_distribution(xi).cov))
+
+            # Whitening in the eigenbasis and then correlating returns gamma
+            whitened = (V.T @ model.gamma) / np.sqrt(xi * w + 1.0 - xi)
+            self.assertTrue(np.allclose(L @ whitened, model.gamma))
+
+        # update_xi keeps the whitened variables fixed while changing xi
+        for _ in range(3):
+            xi, gamma = model.xi, model.gamma
+            model.update_xi()
+            whitened = np.linalg.solve(V * np.sqrt(xi * w + 1.0 - xi), gamma)
+            self.assertTrue(np.allclose(model.gamma, (V * np.sqrt(model.xi * w + 1.0 - model.xi)) @ whitened))
+            self.assertNotEqual(model.xi, xi)
+
+    def test_model_check_finite(self):
+        rng = np.random.RandomState(0)
+        X, y, R = rng.randn(20, 10), rng.randn(20), np.eye(10)
+
+        bad_X = X.copy()
+        bad_X[3, 4] = np.nan
+        with self.assertRaises(ValueError):
+            Probit(X=bad_X, Y=y, R=R)
+        bad_y = y.copy()
+        bad_y[5] = np.inf
+        with self.assertRaises(ValueError):
+            Probit(X=X, Y=bad_y, R=R)
+
+        # On finite inputs, skipping the checks gives the same results
+        np.random.seed(3)
+        checked = Probit(X=X, Y=y, R=R)
+        np.random.seed(3)
+        unchecked = Probit(X=X, Y=y, R=R, check_finite=False)
+        for k in (0, 3, 10):
+            gamma = np.where(np.arange(10) < k, 1.0, -1.0)
+            self.assertEqual(
+                checked.log_marg_like(gamma, 0.0, 2.0, 0.5), unchecked.log_marg_like(gamma, 0.0, 2.0, 0.5)
+            )
+            self.assertEqual(
+                checked.ppi_distribution(gamma, 0.0, 2.0).logpdf(y),
+                unchecked.ppi_distribution(gamma, 0.0, 2.0).logpdf(y)
+            )
+        self.assertEqual(checked.log_joint(), unchecked.log_joint())
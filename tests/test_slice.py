@@ -53,3 +53,19 @@ class SliceTestCase(TestCase):
         # Check to see if we're within 5% of the expected values
         self.assertTrue(np.abs(np.mean(trace[-iters:])) < 0.05)
         self.assertTrue(np.abs(np.var(trace[-iters:]) - 1) < 0.05)
+
+    def test_slice_scalar_logprob(self):
+        """
+        When started from a scalar, the log-probability function should be handed floats, not 1-element arrays.
+        """
+        received = []
+
+        def lognorm(x):
+            received.append(x)
+            return norm.logpdf(x)
+
+        sampler = SliceSampler(lognorm)
+        trace = sampler.chain(0.5, iters=5, burn_in=0)
+        self.assertTrue(all(type(x) is float for x in trace))
+        self.assertTrue(len(received) > 0)
+        self.assertTrue(all(type(x) is float for x in received))
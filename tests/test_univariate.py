@@ -0,0 +1,48 @@
+from unittest import TestCase
+import numpy as np
+from scipy.stats import beta, gamma, norm
+
+from bss.univariate import Beta, Gamma, Normal
+
+
+class UnivariateTestCase(TestCase):
+    def setUp(self):
+        np.random.seed(0)
+
+    def tearDown(self):
+        pass
+
+    def test_logpdf(self):
+        """
+        Check our logpdf values against scipy.stats values for the same inputs, including values outside the support
+        """
+        cases = [
+            (Normal(loc=2.3, scale=0.7), norm(loc=2.3, scale=0.7), [-3.0, 0.0, 2.3, 5.1]),
+            (Gamma(2.5, 4.0), gamma(2.5, scale=1/4.0), [-1.0, 0.0, 0.01, 0.6, 12.0]),
+            (Gamma(1e-6, 1e-6), gamma(1e-6, scale=1e6), [-1.0, 1e-3, 1.0, 1e5]),
+            (Beta(1, 1), beta(1, 1), [-0.5, 0.3, 1.5]),
+            (Beta(0.5, 3.0), beta(0.5, 3.0), [0.001, 0.2, 0.999]),
+        ]
+        for dist, scipy_dist, xs in cases:
+            for x in xs:
+                expected = scipy_dist.logpdf(x)
+                if np.isfinite(expected):
+                    self.assertAlmostEqual(dist.logpdf(x), expected)
+                else:
+                    self.assertEqual(dist.logpdf(x), -np.inf)
+
+    def test_mean(self):
+        for dist, scipy_dist in [
+            (Normal(loc=-1.2, scale=3.0), norm(loc=-1.2, scale=3.0)),
+            (Gamma(2.5, 4.0), gamma(2.5, scale=1/4.0)),
+            (Beta(0.5, 3.0), beta(0.5, 3.0)),
+        ]:
+            self.assertAlmostEqual(dist.mean(), scipy_dist.mean())
+
+    def test_rvs(self):
+        """
+        A non-deterministic test checking that the sample mean of random variates comes close to the true mean.
+        """
+        for dist in [Normal(loc=-1.2, scale=3.0), Gamma(2.5, 4.0), Beta(0.5, 3.0)]:
+            samples = [dist.rvs() for _ in range(10000)]
+            self.assertAlmostEqual(np.mean(samples), dist.mean(), delta=0.1)